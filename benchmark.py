@@ -0,0 +1,198 @@
+# benchmark.py - Medidas de desempenho da engine do jogo da velha (velha.py)
+# https://github.com/RobStelling/JogodaVelhaRL
+#
+# Mede, com sementes fixas e sem depender do notebook:
+# - partidas por segundo do treinamento (sequencial e em lote) e da simulação (sequencial e em lote),
+#   com o tabuleiro em vetor (jogoDaVelha) e em máscaras de bits (jogoDaVelhaBits)
+# - segundos para gerar políticas completas com treinamento_completo
+# - microssegundos por chamada de escolhe_jogada, _resultado_jogo e propaga_recompensa
+# - tempo de carga e gravação e pico de memória de cada política em politicas/
+# - tempo de importação de velha.py em um processo novo, comparado com ORCAMENTO_IMPORTACAO_MS
+# O resultado é gravado em JSON, para comparar versões e detectar regressões.
+#
+# Uso: python benchmark.py [--rapido] [--saida resultados.json] [--verifica-importacao]
+
+import argparse
+import json
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+from contextlib import redirect_stdout
+from pathlib import Path
+
+import velha as jv
+
+SEMENTE = 42
+# Prefixo das políticas gravadas durante as medidas, removidas ao final
+PREFIXO_BENCHMARK = "benchmark_"
+# Tempo máximo de importação de velha.py, em milissegundos, incluindo o numpy
+ORCAMENTO_IMPORTACAO_MS = 300
+# Módulos que não devem ser carregados por import velha (ver _mostra em velha.py)
+MODULOS_ADIADOS = ("IPython", "multiprocessing", "mmap", "copy")
+# Programa executado em um processo novo para medir a importação
+_MEDE_IMPORTACAO = ("import sys, time; inicio = time.perf_counter(); import velha; "
+                    "print(time.perf_counter() - inicio); print(*(modulo for modulo in sys.argv[1:] if modulo in sys.modules))")
+
+
+def semeia():
+    """Reinicia os geradores de números aleatórios usados pela engine"""
+    np.random.seed(SEMENTE)
+    random.seed(SEMENTE)
+
+
+def cronometra(funcao, repeticoes):
+    """Executa funcao repeticoes vezes e retorna o tempo total em segundos"""
+    inicio = time.perf_counter()
+    for _ in range(repeticoes):
+        funcao()
+    return time.perf_counter() - inicio
+
+
+def politicas_treinadas(classe, rodadas):
+    """Retorna políticas X e O treinadas por algumas rodadas, para medir chamadas individuais"""
+    semeia()
+    politica_X, politica_O = classe("X"), classe("O")
+    jv.jogoDaVelha(politica_X, politica_O).treinamento(rodadas, verifica=rodadas + 1)
+    return politica_X, politica_O
+
+
+def mede_treinamento(rodadas):
+    """Partidas por segundo dos modos de treinamento"""
+    resultados = {}
+    for nome, classe in (("Maquina", jv.Maquina), ("MaquinaDensa", jv.MaquinaDensa)):
+        semeia()
+        jogo = jv.jogoDaVelha(classe("X"), classe("O"))
+        tempo = cronometra(lambda: jogo.treinamento(rodadas, verifica=rodadas + 1), 1)
+        resultados[f"treinamento_{nome}"] = rodadas / tempo
+    semeia()
+    jogo = jv.jogoDaVelhaBits(jv.Maquina("X"), jv.Maquina("O"))
+    tempo = cronometra(lambda: jogo.treinamento(rodadas, verifica=rodadas + 1), 1)
+    resultados["treinamento_Maquina_bits"] = rodadas / tempo
+    semeia()
+    jogo = jv.jogoDaVelha(jv.MaquinaDensa("X"), jv.MaquinaDensa("O"))
+    tempo = cronometra(lambda: jogo.treinamento_lote(rodadas * 10, verifica=rodadas * 10 + 1), 1)
+    resultados["treinamento_lote"] = rodadas * 10 / tempo
+    return resultados
+
+
+def mede_treinamento_completo():
+    """Segundos para gerar as políticas de X e O com treinamento_completo"""
+    jogo = jv.jogoDaVelha(jv.Maquina("X"), jv.Maquina("O"))
+    return cronometra(jogo.treinamento_completo, 1)
+
+
+def mede_simulacao(partidas):
+    """Partidas por segundo da simulação entre políticas já treinadas"""
+    politica_X, politica_O = politicas_treinadas(jv.Maquina, 2000)
+    politica_X.taxa_exploracao = politica_O.taxa_exploracao = 0.0
+    jogo = jv.jogoDaVelha(politica_X, politica_O)
+    semeia()
+    resultados = {"simulacao": partidas / cronometra(lambda: jogo.simulacao(partidas), 1)}
+    jogo_bits = jv.jogoDaVelhaBits(politica_X, politica_O)
+    semeia()
+    resultados["simulacao_bits"] = partidas / cronometra(lambda: jogo_bits.simulacao(partidas), 1)
+    tempo = cronometra(lambda: jogo.simulacao_lote(partidas * 10, semente=SEMENTE), 1)
+    resultados["simulacao_lote"] = partidas * 10 / tempo
+    return resultados
+
+
+def mede_chamadas(repeticoes):
+    """Microssegundos por chamada das funções mais usadas no treinamento"""
+    resultados = {}
+    tabuleiro = np.array([1, 0, 2, 0, 1, 0, 0, 2, 0])
+    casas_livres = [casa for casa in range(jv.NUM_CASAS) if tabuleiro[casa] == jv.VAZIA]
+    resultados["_resultado_jogo"] = cronometra(lambda: jv._resultado_jogo(tabuleiro), repeticoes) / repeticoes * 1e6
+    for nome, classe in (("Maquina", jv.Maquina), ("MaquinaDensa", jv.MaquinaDensa)):
+        politica, _ = politicas_treinadas(classe, 2000)
+        semeia()
+        resultados[f"escolhe_jogada_{nome}"] = cronometra(lambda: (politica.escolhe_jogada(casas_livres, tabuleiro),
+                                                                   politica.reinicia()), repeticoes) / repeticoes * 1e6
+        # Uma partida típica: X joga 3 vezes e vence
+        partida = np.array([[0, 0, 0, 0, 0, 0, 0, 0, 0], [1, 0, 0, 0, 2, 0, 0, 0, 0], [1, 1, 0, 0, 2, 0, 0, 2, 0]])
+        jogadas = [0, 1, 2]
+        for posicao in partida:
+            politica.escolhe_jogada(tuple(np.flatnonzero(posicao == jv.VAZIA)), posicao)
+        politica.reinicia()
+        for posicao, jogada in zip(partida, jogadas):
+            politica.acrescenta_estado(posicao, jogada)
+        resultados[f"propaga_recompensa_{nome}"] = cronometra(lambda: politica.propaga_recompensa(jv.VITORIA),
+                                                              repeticoes) / repeticoes * 1e6
+    return resultados
+
+
+def mede_politicas():
+    """Tempo de carga e gravação e pico de memória de cada política salva"""
+    resultados = {}
+    for nome in jv.lista_politicas():
+        politica = jv.Maquina(nome)
+        tracemalloc.start()
+        inicio = time.perf_counter()
+        politica.carrega_politica(nome)
+        carga = time.perf_counter() - inicio
+        _, pico = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        politica.nome = nome
+        gravacao = cronometra(lambda: politica.salva_politica(prefixo=PREFIXO_BENCHMARK), 1)
+        arquivo = Path(jv.PASTA_POLITICAS) / f"{PREFIXO_BENCHMARK}{nome}.{jv.EXTENSAO_POLITICA}"
+        tamanho = arquivo.stat().st_size
+        arquivo.unlink()
+        resultados[nome] = {"estados": len(politica.q), "bytes": tamanho, "carga_s": carga,
+                            "gravacao_s": gravacao, "pico_memoria_bytes": pico}
+    return resultados
+
+
+def mede_importacao(repeticoes):
+    """Tempo de importação de velha.py em processos novos (mediana) e módulos adiados carregados indevidamente"""
+    tempos = []
+    carregados = set()
+    for _ in range(repeticoes):
+        saida = subprocess.run([sys.executable, "-c", _MEDE_IMPORTACAO, *MODULOS_ADIADOS], capture_output=True,
+                               text=True, check=True, cwd=Path(__file__).parent).stdout.splitlines()
+        tempos.append(float(saida[0]) * 1000)
+        carregados.update(saida[1].split() if len(saida) > 1 else [])
+    mediana = statistics.median(tempos)
+    return {"mediana_ms": mediana, "minimo_ms": min(tempos), "orcamento_ms": ORCAMENTO_IMPORTACAO_MS,
+            "dentro_do_orcamento": mediana <= ORCAMENTO_IMPORTACAO_MS and not carregados,
+            "modulos_adiados_carregados": sorted(carregados)}
+
+
+def executa(rapido=False):
+    """Executa todas as medidas e retorna o resultado como dicionário"""
+    escala = 1 if rapido else 10
+    return {
+        "ambiente": {"python": platform.python_version(), "numpy": np.__version__,
+                     "plataforma": platform.platform(), "semente": SEMENTE, "rapido": rapido},
+        "partidas_por_segundo": {**mede_treinamento(1000 * escala), **mede_simulacao(1000 * escala)},
+        "treinamento_completo_s": mede_treinamento_completo(),
+        "microssegundos_por_chamada": mede_chamadas(10000 * escala),
+        "politicas": mede_politicas(),
+        "importacao": mede_importacao(5 if rapido else 20),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Medidas de desempenho da engine do jogo da velha")
+    parser.add_argument("--rapido", action="store_true", help="usa menos rodadas e repetições")
+    parser.add_argument("--saida", help="arquivo JSON de saída, por padrão a saída padrão")
+    parser.add_argument("--verifica-importacao", action="store_true",
+                        help="mede apenas a importação e termina com erro se estiver fora do orçamento")
+    argumentos = parser.parse_args()
+    if argumentos.verifica_importacao:
+        importacao = mede_importacao(20)
+        print(json.dumps(importacao, indent=2))
+        sys.exit(0 if importacao["dentro_do_orcamento"] else 1)
+    # As mensagens de progresso do treinamento vão para a saída de erros, para não misturar com o JSON
+    with redirect_stdout(sys.stderr):
+        resultado = json.dumps(executa(argumentos.rapido), indent=2)
+    if argumentos.saida:
+        with open(argumentos.saida, "w") as arquivo:
+            arquivo.write(resultado)
+    else:
+        print(resultado)
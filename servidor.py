@@ -0,0 +1,293 @@
+# servidor.py - Servidor assíncrono de partidas de jogo da velha contra políticas treinadas (velha.py)
+# https://github.com/RobStelling/JogodaVelhaRL
+#
+# Um único processo atende milhares de partidas simultâneas com asyncio. As jogadas da máquina vêm de
+# políticas somente para leitura (velha.PoliticaCongelada), compartilhadas por todas as partidas, e cada
+# partida guarda apenas o hash do tabuleiro, a vez e a peça do humano (Sessao).
+#
+# Protocolo TCP, uma linha de texto por comando e uma linha de resposta:
+#   NOVA X|O               -> OK <sessão> <estado> <jogada da máquina> <resultado>
+#   JOGA <sessão> <casa>   -> OK <sessão> <estado> <jogada da máquina> <resultado>
+#   FIM <sessão>           -> OK <sessão>
+#   Em caso de erro        -> ERRO <mensagem>
+# NOVA X: o humano joga com X e começa. NOVA O: a máquina joga com X e faz a primeira jogada.
+# <estado> é o hash do tabuleiro (ver velha.gera_hash_tabuleiro), <jogada da máquina> é a casa ou - e
+# <resultado> é -, X, O ou VELHA. A sessão é encerrada automaticamente ao fim da partida. Cada conexão só
+# pode jogar e encerrar as sessões que ela mesma iniciou.
+#
+# As políticas são lidas no formato binário (.pjb, ver velha.carrega_politica_binaria), que não executa código
+# ao ser lido. --converte gera antes os arquivos .pjb a partir dos arquivos pickle (.pjv) das políticas.
+#
+# Uso: python servidor.py [--host 127.0.0.1] [--porta 8765] [--politica-x X1000000-v0.0] [--politica-o O1000000-v0.0]
+#                         [--converte]
+#      python servidor.py --teste-carga 10000 [--concorrencia 1000] [--tcp]
+
+import argparse
+import asyncio
+import random
+import time
+import tracemalloc
+
+import velha as jv
+
+POLITICA_X = "X1000000-v0.0"
+POLITICA_O = "O1000000-v0.0"
+HOST = "127.0.0.1"
+PORTA = 8765
+MAX_SESSOES = 100000
+
+_RESULTADOS = {None: '-', jv.XGANHOU: 'X', jv.OGANHOU: 'O', jv.DEUVELHA: 'VELHA'}
+_PECAS = {'X': jv.X, 'O': jv.O}
+
+
+class Sessao:
+    """Uma partida em andamento: hash do tabuleiro, jogador da vez e peça do humano"""
+    __slots__ = ('estado', 'vez', 'humano')
+
+    def __init__(self, humano):
+        self.estado = 0
+        self.vez = jv.X
+        self.humano = humano
+
+
+class Servidor:
+    """Partidas simultâneas entre humanos (ou clientes remotos) e políticas congeladas
+    politicas: {X: PoliticaCongelada, O: PoliticaCongelada}, a política usada quando a máquina joga com cada peça
+    max_sessoes: número máximo de partidas simultâneas
+    Os métodos nova_sessao, joga e encerra são síncronos e não bloqueiam, e podem ser chamados diretamente
+    por corrotinas no mesmo processo. atende e inicia expõem os mesmos comandos por TCP
+    """
+    def __init__(self, politicas, max_sessoes=MAX_SESSOES):
+        self.politicas = politicas
+        self.max_sessoes = max_sessoes
+        self.sessoes = {}
+        self._proxima = 0
+        # Estatísticas
+        self.partidas = 0
+        self.lances = 0
+        self.pico_sessoes = 0
+
+    def _jogada_maquina(self, sessao):
+        """Faz a jogada da máquina na sessão e retorna a casa jogada"""
+        casa = self.politicas[sessao.vez].jogada(sessao.estado)
+        self._aplica(sessao, casa)
+        return casa
+
+    def _aplica(self, sessao, casa):
+        sessao.estado = jv.joga_estado(sessao.estado, sessao.vez, casa)
+        sessao.vez = jv.O if sessao.vez == jv.X else jv.X
+        self.lances += 1
+
+    def nova_sessao(self, humano=jv.X):
+        """Inicia uma partida, com o humano jogando com a peça indicada
+        Retorna a sessão, o estado, a jogada da máquina (None se o humano começa) e o resultado (None)
+        """
+        if len(self.sessoes) >= self.max_sessoes:
+            raise ValueError("Número máximo de sessões atingido")
+        if humano not in (jv.X, jv.O):
+            raise ValueError(f"Peça inválida: {humano}")
+        sessao = Sessao(humano)
+        numero = self._proxima
+        self._proxima += 1
+        self.sessoes[numero] = sessao
+        self.pico_sessoes = max(self.pico_sessoes, len(self.sessoes))
+        jogada = self._jogada_maquina(sessao) if humano == jv.O else None
+        return numero, sessao.estado, jogada, None
+
+    def joga(self, numero, casa):
+        """Faz a jogada do humano e, se a partida continuar, a resposta da máquina
+        Retorna o estado, a jogada da máquina (None se a partida terminou com a jogada do humano) e o resultado
+        """
+        sessao = self.sessoes.get(numero)
+        if sessao is None:
+            raise ValueError(f"Sessão {numero} não existe")
+        if casa not in jv.casas_livres_estado(sessao.estado):
+            raise ValueError(f"Jogada inválida: {casa}")
+        self._aplica(sessao, casa)
+        jogada = None
+        resultado = jv.resultado_estado(sessao.estado)
+        if resultado is None:
+            jogada = self._jogada_maquina(sessao)
+            resultado = jv.resultado_estado(sessao.estado)
+        if resultado is not None:
+            del self.sessoes[numero]
+            self.partidas += 1
+        return sessao.estado, jogada, resultado
+
+    def encerra(self, numero):
+        """Abandona uma partida em andamento"""
+        if self.sessoes.pop(numero, None) is None:
+            raise ValueError(f"Sessão {numero} não existe")
+
+    def _comando(self, linha, abertas):
+        """Executa um comando do protocolo e retorna a linha de resposta
+        abertas: conjunto das sessões abertas pela conexão, atualizado com as sessões iniciadas e terminadas.
+                 Comandos para sessões de outras conexões são recusados como se a sessão não existisse
+        """
+        partes = linha.split()
+        numericos = all(parte.isdigit() for parte in partes[1:])
+        try:
+            if len(partes) == 2 and partes[0] == 'NOVA' and partes[1] in _PECAS:
+                numero, estado, jogada, resultado = self.nova_sessao(_PECAS[partes[1]])
+                abertas.add(numero)
+            elif len(partes) == 3 and partes[0] == 'JOGA' and numericos:
+                numero = _sessao_da_conexao(partes[1], abertas)
+                estado, jogada, resultado = self.joga(numero, int(partes[2]))
+                if resultado is not None:
+                    abertas.discard(numero)
+            elif len(partes) == 2 and partes[0] == 'FIM' and numericos:
+                numero = _sessao_da_conexao(partes[1], abertas)
+                self.encerra(numero)
+                abertas.discard(numero)
+                return f"OK {numero}\n"
+            else:
+                return f"ERRO Comando inválido: {linha.strip()}\n"
+        except ValueError as erro:
+            return f"ERRO {erro}\n"
+        return f"OK {numero} {estado} {'-' if jogada is None else jogada} {_RESULTADOS[resultado]}\n"
+
+    async def atende(self, leitor, escritor):
+        """Atende uma conexão TCP, que pode jogar várias partidas, até o cliente desconectar
+        As partidas que a conexão deixar em andamento são encerradas quando ela termina
+        """
+        abertas = set()
+        try:
+            while linha := await leitor.readline():
+                try:
+                    resposta = self._comando(linha.decode(), abertas)
+                except UnicodeDecodeError:
+                    resposta = "ERRO Comando inválido: não está em UTF-8\n"
+                escritor.write(resposta.encode())
+                await escritor.drain()
+        except ConnectionError:
+            # Cliente desconectou sem fechar a conexão
+            pass
+        finally:
+            for numero in abertas:
+                if numero in self.sessoes:
+                    self.encerra(numero)
+            escritor.close()
+            try:
+                await escritor.wait_closed()
+            except ConnectionError:
+                pass
+
+    async def inicia(self, host=HOST, porta=PORTA):
+        """Inicia o servidor TCP e retorna o asyncio.Server, porta 0 escolhe uma porta livre"""
+        return await asyncio.start_server(self.atende, host, porta)
+
+
+def _sessao_da_conexao(texto, abertas):
+    """Retorna o número de uma sessão aberta pela conexão, ou levanta ValueError"""
+    numero = int(texto)
+    if numero not in abertas:
+        raise ValueError(f"Sessão {numero} não existe")
+    return numero
+
+
+def carrega_politicas(politica_X=POLITICA_X, politica_O=POLITICA_O):
+    """Carrega, no formato binário, e congela as políticas usadas pela máquina quando joga com X e com O"""
+    return {vez: jv.PoliticaCongelada(jv.carrega_politica_binaria(nome), nome)
+            for vez, nome in ((jv.X, politica_X), (jv.O, politica_O))}
+
+
+async def jogador_local(servidor, partidas, pausa=0.0):
+    """Joga partidas com jogadas aleatórias chamando o servidor diretamente, no mesmo processo
+    pausa: tempo de "pensar" entre as jogadas, durante o qual as outras partidas andam
+    """
+    for _ in range(partidas):
+        numero, estado, _, resultado = servidor.nova_sessao(random.choice((jv.X, jv.O)))
+        while resultado is None:
+            await asyncio.sleep(pausa)
+            estado, _, resultado = servidor.joga(numero, random.choice(jv.casas_livres_estado(estado)))
+
+
+async def jogador_tcp(host, porta, partidas, pausa=0.0):
+    """Joga partidas com jogadas aleatórias por uma conexão TCP com o servidor"""
+    leitor, escritor = await asyncio.open_connection(host, porta)
+    try:
+        for _ in range(partidas):
+            escritor.write(f"NOVA {random.choice('XO')}\n".encode())
+            while True:
+                await escritor.drain()
+                resposta = (await leitor.readline()).decode().split()
+                if resposta[0] != 'OK':
+                    raise ValueError(" ".join(resposta))
+                if resposta[4] != '-':
+                    break
+                await asyncio.sleep(pausa)
+                casa = random.choice(jv.casas_livres_estado(int(resposta[2])))
+                escritor.write(f"JOGA {resposta[1]} {casa}\n".encode())
+    finally:
+        escritor.close()
+        await escritor.wait_closed()
+
+
+def memoria_por_sessao(servidor, sessoes=10000):
+    """Mede com tracemalloc os bytes alocados por partida em andamento, incluindo a entrada em servidor.sessoes"""
+    # A lista de números de sessão, usada apenas para encerrar as sessões, é alocada antes da medida
+    numeros = [None] * sessoes
+    tracemalloc.start()
+    inicio, _ = tracemalloc.get_traced_memory()
+    for indice in range(sessoes):
+        numeros[indice] = servidor.nova_sessao(jv.O)[0]
+    final, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    for numero in numeros:
+        servidor.encerra(numero)
+    return (final - inicio) / sessoes
+
+
+async def teste_carga(servidor, partidas=10000, concorrencia=1000, tcp=False, pausa=0.0):
+    """Joga partidas aleatórias simultâneas contra o servidor e retorna as medidas de desempenho
+    concorrencia: número de clientes jogando ao mesmo tempo, cada um joga suas partidas em sequência
+    tcp: se True os clientes usam o protocolo TCP por loopback (uma conexão por cliente), senão chamam o
+         servidor diretamente
+    """
+    partidas_inicio, lances_inicio = servidor.partidas, servidor.lances
+    por_cliente = [partidas // concorrencia + (cliente < partidas % concorrencia) for cliente in range(concorrencia)]
+    inicio = time.perf_counter()
+    if tcp:
+        tcp_servidor = await servidor.inicia(HOST, 0)
+        porta = tcp_servidor.sockets[0].getsockname()[1]
+        async with tcp_servidor:
+            await asyncio.gather(*(jogador_tcp(HOST, porta, num, pausa) for num in por_cliente if num))
+    else:
+        await asyncio.gather(*(jogador_local(servidor, num, pausa) for num in por_cliente if num))
+    segundos = time.perf_counter() - inicio
+    partidas = servidor.partidas - partidas_inicio
+    return {'partidas': partidas,
+            'segundos': segundos,
+            'partidas_por_segundo': partidas / segundos,
+            'lances_por_segundo': (servidor.lances - lances_inicio) / segundos,
+            'pico_sessoes': servidor.pico_sessoes,
+            'bytes_por_sessao': memoria_por_sessao(servidor)}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Servidor de partidas de jogo da velha contra políticas treinadas")
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--porta", type=int, default=PORTA)
+    parser.add_argument("--politica-x", default=POLITICA_X, help="política usada quando a máquina joga com X")
+    parser.add_argument("--politica-o", default=POLITICA_O, help="política usada quando a máquina joga com O")
+    parser.add_argument("--converte", action="store_true",
+                        help="gera antes os arquivos binários (.pjb) das políticas a partir dos arquivos pickle (.pjv)")
+    parser.add_argument("--teste-carga", type=int, metavar="PARTIDAS", help="executa um teste de carga em vez de servir")
+    parser.add_argument("--concorrencia", type=int, default=1000, help="clientes simultâneos no teste de carga")
+    parser.add_argument("--tcp", action="store_true", help="teste de carga pelo protocolo TCP em vez de chamadas diretas")
+    argumentos = parser.parse_args()
+    if argumentos.converte:
+        for nome in (argumentos.politica_x, argumentos.politica_o):
+            jv.converte_para_binaria(nome)
+    servidor = Servidor(carrega_politicas(argumentos.politica_x, argumentos.politica_o))
+    if argumentos.teste_carga:
+        medidas = asyncio.run(teste_carga(servidor, argumentos.teste_carga, argumentos.concorrencia, argumentos.tcp))
+        for medida, valor in medidas.items():
+            print(f"{medida}: {valor:.2f}" if isinstance(valor, float) else f"{medida}: {valor}")
+    else:
+        async def serve():
+            tcp_servidor = await servidor.inicia(argumentos.host, argumentos.porta)
+            print(f"Servindo em {argumentos.host}:{argumentos.porta}", flush=True)
+            async with tcp_servidor:
+                await tcp_servidor.serve_forever()
+        asyncio.run(serve())